@@ -0,0 +1,146 @@
+"""
+Shared loader for the place list in Orte_Identifikation_factgrid.xlsx.
+
+Both scripts read the same Excel file. Loading goes through here so the
+parsed sheet is reused within a process and mirrored to Parquet for
+faster loads on later runs.
+"""
+
+import functools
+import json
+from pathlib import Path
+
+import pandas as pd
+
+# Prefer the Rust-based calamine reader; fall back to openpyxl if it isn't installed
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
+
+# Parquet mirror needs pyarrow; without it only the Excel file is used
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# Columns used by any of the scripts
+PLACE_COLUMNS = ["Schreibweise Ortsregister", "Wikidata URL", "Region"]
+
+# Parquet schema metadata key describing the Excel file a mirror was built from
+MIRROR_SOURCE_KEY = b"kronruthenien.places_source"
+
+def parquet_mirror_path(excel_path):
+    """
+    Path of the Parquet mirror for an Excel file.
+
+    Args:
+        excel_path (str): Path to the Excel file
+
+    Returns:
+        Path: Path to the Parquet file next to the Excel file
+    """
+    return Path(excel_path).with_suffix(".parquet")
+
+def mirror_source_info(mtime_ns, size):
+    """
+    Source description stored with a Parquet mirror.
+
+    Args:
+        mtime_ns (int): Modification time of the Excel file in nanoseconds
+        size (int): Size of the Excel file in bytes
+
+    Returns:
+        bytes: JSON-encoded source description
+    """
+    return json.dumps({"mtime_ns": mtime_ns, "size": size, "columns": PLACE_COLUMNS}).encode("utf-8")
+
+def read_mirror(parquet_path, source_info):
+    """
+    Read the Parquet mirror if it was built from the given Excel file state.
+
+    Args:
+        parquet_path (Path): Path to the Parquet mirror
+        source_info (bytes): Expected source description (see mirror_source_info)
+
+    Returns:
+        DataFrame or None: Mirrored place columns, or None if the mirror is
+        missing, unreadable or stale
+    """
+    if not parquet_path.exists():
+        return None
+
+    try:
+        metadata = pq.read_schema(parquet_path).metadata or {}
+        if metadata.get(MIRROR_SOURCE_KEY) != source_info:
+            return None
+        return pd.read_parquet(parquet_path)
+    except Exception as e:
+        print(f"Warning: ignoring unreadable Parquet mirror {parquet_path}: {e}")
+        return None
+
+def write_mirror(df, parquet_path, source_info):
+    """
+    Write the Parquet mirror together with its source description.
+
+    Args:
+        df (DataFrame): Place columns read from the Excel file
+        parquet_path (Path): Path to the Parquet mirror
+        source_info (bytes): Source description (see mirror_source_info)
+    """
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[MIRROR_SOURCE_KEY] = source_info
+        pq.write_table(table.replace_schema_metadata(metadata), parquet_path)
+    except Exception as e:
+        print(f"Warning: could not write Parquet mirror {parquet_path}: {e}")
+
+@functools.lru_cache(maxsize=4)
+def load_places_cached(path, mtime_ns, size):
+    """
+    Load the place columns from the Excel file, memoized on path, mtime and size.
+
+    A Parquet mirror is read instead of the Excel file only if it was built
+    from a file with exactly this mtime and size and for the current
+    PLACE_COLUMNS; otherwise the Excel file is read and the mirror rewritten.
+
+    Args:
+        path (str): Path to the Excel file
+        mtime_ns (int): Modification time of the Excel file in nanoseconds (cache key)
+        size (int): Size of the Excel file in bytes (cache key)
+
+    Returns:
+        DataFrame: Available place columns as strings
+    """
+    parquet_path = parquet_mirror_path(path)
+    source_info = mirror_source_info(mtime_ns, size)
+
+    if PARQUET_AVAILABLE:
+        df = read_mirror(parquet_path, source_info)
+        if df is not None:
+            return df
+
+    df = pd.read_excel(path, usecols=lambda col: col in PLACE_COLUMNS, dtype=str, engine=EXCEL_ENGINE)
+
+    if PARQUET_AVAILABLE:
+        write_mirror(df, parquet_path, source_info)
+
+    return df
+
+def load_places(excel_path):
+    """
+    Load the place columns from the Excel file.
+
+    Args:
+        excel_path (str): Path to the Excel file
+
+    Returns:
+        DataFrame: Copy of the available place columns, safe to modify
+    """
+    excel_path = Path(excel_path)
+    stat = excel_path.stat()
+    return load_places_cached(str(excel_path), stat.st_mtime_ns, stat.st_size).copy()
@@ -7,10 +7,66 @@ This script reads the Excel file containing place names and their Wikidata URLs,
 then adds the wikidata_url property to matching places in the GeoJSON file.
 """
 
-import pandas as pd
-import json
+import orjson
 import os
+import gzip
+import logging
+import unicodedata
+from collections import defaultdict
 from pathlib import Path
+from jellyfish import soundex
+from rapidfuzz import fuzz, process
+
+from _places import load_places
+
+logger = logging.getLogger(__name__)
+
+# Minimum token-sort-ratio score for accepting a fuzzy name match.
+# token_sort_ratio ignores word order but, unlike token_set_ratio, does not score
+# a name 100 against a longer name containing it (e.g. "Glinik" vs "Glinik Górny").
+FUZZY_SCORE_CUTOFF = 90
+
+# Letters NFKD does not decompose and apostrophe variants from transliterations
+_NAME_TRANSLATION = str.maketrans({
+    'ł': 'l', 'Ł': 'L',
+    'ø': 'o', 'Ø': 'O',
+    'đ': 'd', 'Đ': 'D',
+    '’': "'", 'ʼ': "'", '′': "'", '‘': "'",
+})
+
+def normalize_place_name(name):
+    """
+    Normalize a place name for tolerant matching.
+    
+    Decomposes the name (NFKD), drops combining diacritics, maps letters
+    without a decomposition (e.g. "ł") and apostrophe variants to their
+    plain forms and casefolds it, so that e.g. "Łańcut" and "lancut" or
+    "Stara Sil’" and "Stara Sil'" map to the same key.
+    
+    Args:
+        name (str): Place name
+        
+    Returns:
+        str: Normalized place name
+    """
+    decomposed = unicodedata.normalize('NFKD', name).translate(_NAME_TRANSLATION)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold().strip()
+
+def soundex_key(normalized_name):
+    """
+    Soundex code of the first word of a normalized place name.
+    
+    Used to bucket candidates before fuzzy matching, so that only names
+    that sound alike are compared.
+    
+    Args:
+        normalized_name (str): Place name as returned by normalize_place_name
+        
+    Returns:
+        str: Soundex code (empty for empty names)
+    """
+    words = normalized_name.split()
+    return soundex(words[0]) if words else ''
 
 def load_excel_data(excel_path):
     """
@@ -23,15 +79,16 @@ def load_excel_data(excel_path):
         dict: Dictionary mapping place names to Wikidata URLs
     """
     try:
-        # Read Excel file
-        df = pd.read_excel(excel_path)
+        required_columns = ["Schreibweise Ortsregister", "Wikidata URL"]
+        
+        # Read the place columns as strings (shared with create_place_geojson.py)
+        df = load_places(excel_path)
         
         # Print column names for debugging
         print("Available columns in Excel file:")
         print(df.columns.tolist())
         
         # Check if required columns exist
-        required_columns = ["Schreibweise Ortsregister", "Wikidata URL"]
         missing_columns = [col for col in required_columns if col not in df.columns]
         
         if missing_columns:
@@ -40,14 +97,9 @@ def load_excel_data(excel_path):
             return {}
         
         # Create mapping dictionary, filtering out rows with empty values
-        place_wikidata_map = {}
-        for _, row in df.iterrows():
-            place_name = row["Schreibweise Ortsregister"]
-            wikidata_url = row["Wikidata URL"]
-            
-            # Only add if both values are not empty/NaN
-            if pd.notna(place_name) and pd.notna(wikidata_url) and place_name.strip() and wikidata_url.strip():
-                place_wikidata_map[place_name.strip()] = wikidata_url.strip()
+        sub = df[required_columns].dropna().astype(str).apply(lambda col: col.str.strip())
+        sub = sub[(sub["Schreibweise Ortsregister"] != "") & (sub["Wikidata URL"] != "")]
+        place_wikidata_map = dict(zip(sub["Schreibweise Ortsregister"], sub["Wikidata URL"]))
         
         print(f"Loaded {len(place_wikidata_map)} place-Wikidata mappings from Excel file")
         return place_wikidata_map
@@ -61,30 +113,50 @@ def load_geojson(geojson_path):
     Load GeoJSON data from file.
     
     Args:
-        geojson_path (str): Path to the GeoJSON file
+        geojson_path (str): Path to the GeoJSON file (plain or gzip-compressed ".gz")
         
     Returns:
         dict: GeoJSON data
     """
     try:
-        with open(geojson_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        opener = gzip.open if str(geojson_path).endswith('.gz') else open
+        with opener(geojson_path, 'rb') as f:
+            return orjson.loads(f.read())
     except Exception as e:
         print(f"Error reading GeoJSON file: {e}")
         return None
 
-def save_geojson(geojson_data, output_path):
+def save_geojson(geojson_data, output_path, write_gzip=True, write_ndjson=False):
     """
     Save GeoJSON data to file.
     
+    Besides the indented file, a compact gzip-compressed copy
+    ("<name>.geojson.gz") is written for faster programmatic re-reads.
+    
     Args:
         geojson_data (dict): GeoJSON data
         output_path (str): Path to save the file
+        write_gzip (bool): Also write a compact ".geojson.gz" copy
+        write_ndjson (bool): Also write the features as newline-delimited JSON (".ndjson")
     """
+    output_path = Path(output_path)
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(geojson_data, f, indent=2, ensure_ascii=False)
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(geojson_data, option=orjson.OPT_INDENT_2))
         print(f"GeoJSON saved to: {output_path}")
+        
+        if write_gzip:
+            gzip_path = output_path.with_suffix(output_path.suffix + '.gz')
+            with gzip.open(gzip_path, 'wb', compresslevel=3) as f:
+                f.write(orjson.dumps(geojson_data))
+            print(f"Compressed GeoJSON saved to: {gzip_path}")
+        
+        if write_ndjson:
+            ndjson_path = output_path.with_suffix('.ndjson')
+            with open(ndjson_path, 'wb') as f:
+                for feature in geojson_data.get('features', []):
+                    f.write(orjson.dumps(feature) + b"\n")
+            print(f"NDJSON saved to: {ndjson_path}")
     except Exception as e:
         print(f"Error saving GeoJSON file: {e}")
 
@@ -103,31 +175,76 @@ def add_wikidata_urls(geojson_data, place_wikidata_map):
         print("Invalid GeoJSON data")
         return geojson_data, 0, 0
     
-    match_count = 0
     total_features = len(geojson_data['features'])
     
-    # Track which Excel entries were matched
-    matched_excel_entries = set()
-    
+    # Index features by normalized name once, so each Excel entry is an O(1) lookup
+    feature_index = defaultdict(list)
     for feature in geojson_data['features']:
         if 'properties' in feature and 'name' in feature['properties']:
             place_name = feature['properties']['name'].strip()
+            feature_index[normalize_place_name(place_name)].append((place_name, feature))
+    
+    # Matched features by id: (Excel entry assigned, whether the match was exact)
+    matched_features = {}
+    
+    # Match Excel entries case- and diacritic-insensitively; exact matches take precedence
+    for excel_name, wikidata_url in place_wikidata_map.items():
+        for place_name, feature in feature_index.get(normalize_place_name(excel_name), ()):
+            exact = place_name == excel_name
+            previous = matched_features.get(id(feature))
+            if previous is not None and (previous[1] or not exact):
+                continue
             
-            # Try exact match first
-            if place_name in place_wikidata_map:
-                feature['properties']['wikidata_url'] = place_wikidata_map[place_name]
-                matched_excel_entries.add(place_name)
-                match_count += 1
-                print(f"Matched: {place_name} -> {place_wikidata_map[place_name]}")
+            feature['properties']['wikidata_url'] = wikidata_url
+            matched_features[id(feature)] = (excel_name, exact)
+            if exact:
+                logger.debug("Matched: %s -> %s", place_name, wikidata_url)
             else:
-                # Try case-insensitive match
-                for excel_name, wikidata_url in place_wikidata_map.items():
-                    if place_name.lower() == excel_name.lower():
-                        feature['properties']['wikidata_url'] = wikidata_url
-                        matched_excel_entries.add(excel_name)
-                        match_count += 1
-                        print(f"Matched (case-insensitive): {place_name} -> {wikidata_url}")
-                        break
+                logger.debug("Matched (normalized): %s -> %s", place_name, wikidata_url)
+    
+    norm_map = {normalize_place_name(k): (k, v) for k, v in place_wikidata_map.items()}
+    
+    # Feature names still without a match; fuzzy matching is skipped entirely if none remain
+    remaining = [norm_name for norm_name in feature_index if norm_name not in norm_map]
+    
+    # Bucket normalized Excel names by Soundex so fuzzy matching only compares similar-sounding names
+    soundex_buckets = defaultdict(list)
+    if remaining:
+        for norm_name in norm_map:
+            soundex_buckets[soundex_key(norm_name)].append(norm_name)
+    
+    # Fuzzy matches are reported separately so they can be reviewed
+    fuzzy_matches = []
+    
+    # Fall back to fuzzy matching for near-miss spellings, once per distinct name
+    for norm_name in remaining:
+        entries = feature_index[norm_name]
+        fuzzy_hit = process.extractOne(
+            norm_name,
+            soundex_buckets.get(soundex_key(norm_name), []),
+            scorer=fuzz.token_sort_ratio,
+            score_cutoff=FUZZY_SCORE_CUTOFF
+        )
+        if not fuzzy_hit:
+            continue
+        
+        excel_name, wikidata_url = norm_map[fuzzy_hit[0]]
+        for place_name, feature in entries:
+            feature['properties']['wikidata_url'] = wikidata_url
+            matched_features[id(feature)] = (excel_name, False)
+            fuzzy_matches.append((place_name, excel_name, fuzzy_hit[1]))
+            logger.debug("Matched (fuzzy, %.0f): %s ~ %s -> %s", fuzzy_hit[1], place_name, excel_name, wikidata_url)
+    
+    match_count = len(matched_features)
+    
+    # Excel entries whose URL ended up on at least one feature
+    matched_excel_entries = {excel_name for excel_name, _ in matched_features.values()}
+    
+    # Report fuzzy matches for manual review
+    if fuzzy_matches:
+        print(f"\nFuzzy matches to review ({len(fuzzy_matches)}):")
+        for place_name, excel_name, score in fuzzy_matches:
+            print(f"  - {place_name} ~ {excel_name} (score {score:.0f})")
     
     # Report unmatched Excel entries
     unmatched_excel = set(place_wikidata_map.keys()) - matched_excel_entries
@@ -140,6 +257,8 @@ def add_wikidata_urls(geojson_data, place_wikidata_map):
 
 def main():
     """Main function to execute the script."""
+    logging.basicConfig(level=logging.WARNING)
+    
     # Set up file paths
     script_dir = Path(__file__).parent
     data_dir = script_dir.parent / "data"
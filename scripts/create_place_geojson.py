@@ -1,10 +1,87 @@
-import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import os
+import orjson
 import time
+import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Optional, Tuple
 import re
+import tempfile
+from pathlib import Path
 
+from _places import load_places
+
+logger = logging.getLogger(__name__)
+
+# Pattern für Wikidata-ID (Q gefolgt von Zahlen)
+_QID_RE = re.compile(r'Q\d+')
+
+# Pattern für Koordinaten im Format "Point(longitude latitude)"
+_POINT_RE = re.compile(r'Point\(([+-]?\d+\.?\d*)\s+([+-]?\d+\.?\d*)\)')
+
+# Persistenter Cache für Koordinaten-Abfragen (Wikidata-ID -> [Latitude, Longitude]).
+# Nur gefundene Koordinaten werden gespeichert; mit WIKIDATA_REFRESH_CACHE=1 werden
+# alle IDs neu abgefragt und der Cache aktualisiert.
+CACHE_PATH = Path(__file__).resolve().parent.parent / "data" / ".wikidata_coords_cache.json"
+
+def load_coordinates_cache(cache_path: Path = CACHE_PATH) -> Dict[str, List[float]]:
+    """
+    Lädt den Koordinaten-Cache von der Festplatte.
+    
+    Args:
+        cache_path: Pfad zur Cache-Datei
+        
+    Returns:
+        Dictionary von Wikidata-ID auf [Latitude, Longitude]
+    """
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            # Negative Einträge älterer Cache-Versionen verwerfen
+            return {k: v for k, v in json.load(f).items() if v}
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Fehler beim Laden des Koordinaten-Caches: {e}")
+        return {}
+
+def save_coordinates_cache(cache_path: Path = CACHE_PATH):
+    """
+    Schreibt den Koordinaten-Cache auf die Festplatte.
+    
+    Args:
+        cache_path: Pfad zur Cache-Datei
+    """
+    try:
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump(_CACHE, f, ensure_ascii=False)
+    except Exception as e:
+        print(f"Fehler beim Speichern des Koordinaten-Caches: {e}")
+
+_CACHE = load_coordinates_cache()
+
+# Gemeinsame HTTP-Session, damit Verbindungen zu Wikidata wiederverwendet werden
+_SESSION = requests.Session()
+_SESSION.headers.update({
+    'User-Agent': 'Python Script for Map Creation/1.0 (https://example.com/contact)',
+    'Accept': 'application/sparql-results+json'
+})
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=None  # SPARQL-POSTs sind rein lesend und dürfen wiederholt werden
+    )
+))
+
+@functools.lru_cache(maxsize=None)
 def extract_wikidata_id(url: str) -> Optional[str]:
     """
     Extrahiert die Wikidata-ID aus einer Wikidata-URL.
@@ -15,69 +92,187 @@ def extract_wikidata_id(url: str) -> Optional[str]:
     Returns:
         Wikidata-ID (z.B. "Q123456") oder None falls nicht gefunden
     """
-    if not url or pd.isna(url):
+    if not url:
         return None
     
-    # Pattern für Wikidata-ID (Q gefolgt von Zahlen)
-    pattern = r'Q\d+'
-    match = re.search(pattern, str(url))
+    match = _QID_RE.search(url)
     
     return match.group() if match else None
 
-def get_coordinates_from_wikidata(wikidata_id: str) -> Optional[Tuple[float, float]]:
+def parse_coordinates(coords_string: str) -> Optional[Tuple[float, float]]:
     """
-    Ruft die Koordinaten (P625) von Wikidata ab.
+    Wandelt einen WKT-Punkt von Wikidata in Koordinaten um.
     
     Args:
-        wikidata_id: Wikidata-ID (z.B. "Q123456")
+        coords_string: Koordinaten im Format "Point(longitude latitude)"
         
     Returns:
-        Tuple mit (Latitude, Longitude) oder None falls nicht gefunden
+        Tuple mit (Latitude, Longitude) oder None falls nicht lesbar
     """
-    if not wikidata_id:
-        return None
+    # Koordinaten aus dem Format "Point(longitude latitude)" extrahieren
+    coords_match = _POINT_RE.search(coords_string)
+    if coords_match:
+        longitude = float(coords_match.group(1))
+        latitude = float(coords_match.group(2))
+        return (latitude, longitude)
+    
+    return None
+
+class RateLimiter:
+    """
+    Einfacher Token-Bucket, der Anfragen über mehrere Threads hinweg drosselt.
+    """
+    
+    def __init__(self, rate: float, capacity: int = 1):
+        """
+        Args:
+            rate: Erlaubte Anfragen pro Sekunde
+            capacity: Maximale Anzahl direkt aufeinanderfolgender Anfragen
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
     
+    def acquire(self):
+        """Blockiert, bis eine weitere Anfrage erlaubt ist."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# Höchstens zwei Anfragen pro Sekunde an Wikidata, egal wie viele Threads laufen
+_RATE_LIMITER = RateLimiter(rate=2.0)
+
+def fetch_coordinates_chunk(wikidata_ids: List[str]) -> Optional[Dict[str, Tuple[float, float]]]:
+    """
+    Ruft die Koordinaten (P625) für einen Block von Wikidata-IDs mit einer
+    einzigen SPARQL-Anfrage ab.
+    
+    Args:
+        wikidata_ids: Liste von Wikidata-IDs
+        
+    Returns:
+        Dictionary von Wikidata-ID auf (Latitude, Longitude) oder None falls
+        die Anfrage fehlgeschlagen ist
+    """
     # Wikidata SPARQL Endpoint
     sparql_url = "https://query.wikidata.org/sparql"
+    entity_prefix = "http://www.wikidata.org/entity/"
     
-    # SPARQL Query für Koordinaten (P625)
-    query = f"""
-    SELECT ?coordinates WHERE {{
-        wd:{wikidata_id} wdt:P625 ?coordinates.
-    }}
-    """
+    # SPARQL Query für Koordinaten (P625) aller IDs im Block
+    query = (
+        "SELECT ?item ?coord WHERE { VALUES ?item { "
+        + " ".join(f"wd:{i}" for i in wikidata_ids)
+        + " } ?item wdt:P625 ?coord. }"
+    )
     
-    headers = {
-        'User-Agent': 'Python Script for Map Creation/1.0 (https://example.com/contact)',
-        'Accept': 'application/sparql-results+json'
-    }
+    _RATE_LIMITER.acquire()
     
     try:
-        response = requests.get(
+        response = _SESSION.post(
             sparql_url,
-            params={'query': query, 'format': 'json'},
-            headers=headers,
-            timeout=10
+            data={'query': query, 'format': 'json'},
+            timeout=60
         )
         
-        if response.status_code == 200:
-            data = response.json()
+        if response.status_code != 200:
+            print(f"Fehler beim Abrufen der Koordinaten (HTTP {response.status_code}) für {len(wikidata_ids)} IDs")
+            return None
+        
+        coords_map = {}
+        for binding in response.json()['results']['bindings']:
+            wikidata_id = binding['item']['value'].replace(entity_prefix, '')
             
-            if data['results']['bindings']:
-                coords_string = data['results']['bindings'][0]['coordinates']['value']
-                
-                # Koordinaten aus dem Format "Point(longitude latitude)" extrahieren
-                coords_match = re.search(r'Point\(([+-]?\d+\.?\d*)\s+([+-]?\d+\.?\d*)\)', coords_string)
-                if coords_match:
-                    longitude = float(coords_match.group(1))
-                    latitude = float(coords_match.group(2))
-                    return (latitude, longitude)
-                    
-        return None
+            # Bei mehreren Koordinaten gilt die erste, wie bei der Einzelabfrage
+            if wikidata_id in coords_map:
+                continue
+            
+            coordinates = parse_coordinates(binding['coord']['value'])
+            if coordinates:
+                coords_map[wikidata_id] = coordinates
         
+        return coords_map
+    
     except Exception as e:
-        print(f"Fehler beim Abrufen der Koordinaten für {wikidata_id}: {e}")
+        print(f"Fehler beim Abrufen der Koordinaten für {len(wikidata_ids)} IDs: {e}")
+        return None
+
+def get_coordinates_bulk(wikidata_ids: List[str], chunk_size: int = 200, max_workers: int = 4,
+                         refresh_cache: bool = False) -> Dict[str, Tuple[float, float]]:
+    """
+    Ruft die Koordinaten (P625) für mehrere Wikidata-IDs gebündelt ab.
+    
+    Pro Block von bis zu ``chunk_size`` IDs wird nur eine SPARQL-Anfrage
+    mit einer VALUES-Klausel gestellt; bis zu ``max_workers`` Blöcke laufen
+    parallel. Gefundene Koordinaten werden im Cache gespeichert; IDs ohne
+    Koordinaten werden bei jedem Aufruf erneut abgefragt.
+    
+    Args:
+        wikidata_ids: Liste von Wikidata-IDs (z.B. ["Q123456", "Q654321"])
+        chunk_size: Maximale Anzahl IDs pro Anfrage
+        max_workers: Maximale Anzahl gleichzeitiger Anfragen
+        refresh_cache: Cache ignorieren und alle IDs neu abfragen
+        
+    Returns:
+        Dictionary von Wikidata-ID auf (Latitude, Longitude); IDs ohne
+        Koordinaten fehlen im Ergebnis
+    """
+    coords_map = {}
+    
+    # Bereits bekannte IDs aus dem Cache beantworten, Rest abfragen
+    missing_ids = []
+    for wikidata_id in dict.fromkeys(i for i in wikidata_ids if i):
+        if not refresh_cache and wikidata_id in _CACHE:
+            coords_map[wikidata_id] = tuple(_CACHE[wikidata_id])
+        else:
+            missing_ids.append(wikidata_id)
+    
+    chunks = [missing_ids[start:start + chunk_size] for start in range(0, len(missing_ids), chunk_size)]
+    if not chunks:
+        return coords_map
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch_coordinates_chunk, chunk): chunk for chunk in chunks}
+        
+        for future in as_completed(futures):
+            chunk_coords = future.result()
+            if chunk_coords is None:
+                continue
+            
+            coords_map.update(chunk_coords)
+            
+            # Nur gefundene Koordinaten cachen; veraltete Einträge ohne Koordinaten entfernen
+            for wikidata_id in futures[future]:
+                coordinates = chunk_coords.get(wikidata_id)
+                if coordinates:
+                    _CACHE[wikidata_id] = list(coordinates)
+                else:
+                    _CACHE.pop(wikidata_id, None)
+    
+    return coords_map
+
+def get_coordinates_from_wikidata(wikidata_id: str) -> Optional[Tuple[float, float]]:
+    """
+    Ruft die Koordinaten (P625) von Wikidata ab.
+    
+    Args:
+        wikidata_id: Wikidata-ID (z.B. "Q123456")
+        
+    Returns:
+        Tuple mit (Latitude, Longitude) oder None falls nicht gefunden
+    """
+    if not wikidata_id:
         return None
+    
+    return get_coordinates_bulk([wikidata_id]).get(wikidata_id)
 
 def create_geojson_feature(name: str, region: str, coordinates: Tuple[float, float]) -> Dict:
     """
@@ -105,22 +300,80 @@ def create_geojson_feature(name: str, region: str, coordinates: Tuple[float, flo
         }
     }
 
-def process_excel_to_geojson(excel_file: str, output_file: str = "orte.geojson"):
+class GeoJSONFeatureWriter:
+    """
+    Schreibt eine FeatureCollection Feature für Feature in eine Datei, ohne
+    die gesamte Sammlung im Speicher zu halten.
+    
+    Die Ausgabe entspricht ``orjson.dumps(..., option=orjson.OPT_INDENT_2)``
+    der vollständigen FeatureCollection. Geschrieben wird in eine temporäre
+    Datei im selben Verzeichnis, die erst nach fehlerfreiem Abschluss die
+    Zieldatei ersetzt; bei einem Abbruch bleibt die bisherige Datei erhalten.
+    """
+    
+    def __init__(self, output_file: str):
+        """
+        Args:
+            output_file: Pfad zur Ausgabe-GeoJSON-Datei
+        """
+        self.output_file = output_file
+        self.file = None
+        self.count = 0
+    
+    def __enter__(self):
+        output_dir = os.path.dirname(os.path.abspath(self.output_file))
+        self.file = tempfile.NamedTemporaryFile(
+            'wb', dir=output_dir, prefix='.' + os.path.basename(self.output_file) + '.', suffix='.tmp', delete=False
+        )
+        self.file.write(b'{\n  "type": "FeatureCollection",\n  "features": [')
+        return self
+    
+    def write(self, feature: Dict):
+        """
+        Hängt ein Feature an die Datei an.
+        
+        Args:
+            feature: GeoJSON-Feature als Dictionary
+        """
+        data = orjson.dumps(feature, option=orjson.OPT_INDENT_2)
+        self.file.write(b',\n    ' if self.count else b'\n    ')
+        self.file.write(data.replace(b'\n', b'\n    '))
+        self.count += 1
+    
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.file.write(b'\n  ]\n}' if self.count else b']\n}')
+            self.file.close()
+            if exc_type is None:
+                # Rechte der bisherigen Datei übernehmen (temporäre Dateien sind nur für den Besitzer lesbar)
+                mode = os.stat(self.output_file).st_mode & 0o777 if os.path.exists(self.output_file) else 0o644
+                os.chmod(self.file.name, mode)
+                os.replace(self.file.name, self.output_file)
+        finally:
+            # Unvollständige temporäre Datei nicht liegen lassen
+            if os.path.exists(self.file.name):
+                os.remove(self.file.name)
+        return False
+
+def process_excel_to_geojson(excel_file: str, output_file: str = "orte.geojson", refresh_cache: bool = False):
     """
     Verarbeitet die Excel-Datei und erstellt eine GeoJSON-Datei.
     
     Args:
         excel_file: Pfad zur Excel-Datei
         output_file: Pfad zur Ausgabe-GeoJSON-Datei
+        refresh_cache: Koordinaten-Cache ignorieren und alle IDs neu abfragen
     """
     print(f"Lade Excel-Datei: {excel_file}")
     
     try:
-        # Excel-Datei laden
-        df = pd.read_excel(excel_file)
+        required_columns = ["Wikidata URL", "Schreibweise Ortsregister", "Region"]
+        
+        # Excel-Datei laden, nur benötigte Spalten als Text (gemeinsam mit add_wikidata_to_geojson.py)
+        df = load_places(excel_file)
         
         # Spaltennamen prüfen
-        required_columns = ["Wikidata URL", "Schreibweise Ortsregister", "Region"]
         missing_columns = [col for col in required_columns if col not in df.columns]
         
         if missing_columns:
@@ -130,26 +383,23 @@ def process_excel_to_geojson(excel_file: str, output_file: str = "orte.geojson")
         
         print(f"Gefundene Einträge: {len(df)}")
         
-        # GeoJSON-Struktur initialisieren
-        geojson = {
-            "type": "FeatureCollection",
-            "features": []
-        }
-        
         successful_count = 0
         failed_count = 0
         
-        # Jeden Eintrag verarbeiten
-        for index, row in df.iterrows():
-            name = row["Schreibweise Ortsregister"]
-            region = row["Region"]
-            wikidata_url = row["Wikidata URL"]
-            
-            # Überspringe Einträge ohne Namen
-            if pd.isna(name) or not name.strip():
-                print(f"Überspringe Eintrag {index + 1}: Kein Name")
-                continue
-            
+        # Fehlende URLs als leere Strings behandeln, Namen einmalig bereinigen
+        df["Wikidata URL"] = df["Wikidata URL"].fillna("")
+        df["Schreibweise Ortsregister"] = df["Schreibweise Ortsregister"].str.strip()
+        
+        # Überspringe Einträge ohne Namen
+        names = df["Schreibweise Ortsregister"]
+        has_name = names.notna() & (names != "")
+        for index in df.index[~has_name]:
+            print(f"Überspringe Eintrag {index + 1}: Kein Name")
+        
+        # Gültige Einträge vorab sammeln
+        entries = []
+        rows = df.loc[has_name, ["Schreibweise Ortsregister", "Region", "Wikidata URL"]]
+        for name, region, wikidata_url in rows.itertuples(index=False, name=None):
             # Wikidata-ID extrahieren
             wikidata_id = extract_wikidata_id(wikidata_url)
             if not wikidata_id:
@@ -157,26 +407,28 @@ def process_excel_to_geojson(excel_file: str, output_file: str = "orte.geojson")
                 failed_count += 1
                 continue
             
-            print(f"Verarbeite '{name}' (ID: {wikidata_id})...")
-            
-            # Koordinaten von Wikidata abrufen
-            coordinates = get_coordinates_from_wikidata(wikidata_id)
-            if coordinates:
-                # GeoJSON-Feature erstellen
-                feature = create_geojson_feature(name, region, coordinates)
-                geojson["features"].append(feature)
-                successful_count += 1
-                print(f"  ✓ Koordinaten gefunden: {coordinates}")
-            else:
-                print(f"  ✗ Keine Koordinaten gefunden für '{name}'")
-                failed_count += 1
-            
-            # Kurze Pause um Wikidata-Server nicht zu überlasten
-            time.sleep(0.5)
+            entries.append((name, region, wikidata_id))
         
-        # GeoJSON-Datei speichern
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(geojson, f, ensure_ascii=False, indent=2)
+        # Koordinaten aller Einträge gebündelt von Wikidata abrufen
+        print(f"Rufe Koordinaten für {len(entries)} Einträge von Wikidata ab...")
+        coords_map = get_coordinates_bulk([wikidata_id for _, _, wikidata_id in entries], refresh_cache=refresh_cache)
+        save_coordinates_cache()
+        
+        # Jeden Eintrag verarbeiten und direkt in die GeoJSON-Datei schreiben
+        with GeoJSONFeatureWriter(output_file) as writer:
+            for name, region, wikidata_id in entries:
+                logger.debug("Verarbeite '%s' (ID: %s)...", name, wikidata_id)
+                
+                coordinates = coords_map.get(wikidata_id)
+                if coordinates:
+                    # GeoJSON-Feature erstellen
+                    feature = create_geojson_feature(name, region, coordinates)
+                    writer.write(feature)
+                    successful_count += 1
+                    logger.debug("  ✓ Koordinaten gefunden: %s", coordinates)
+                else:
+                    print(f"  ✗ Keine Koordinaten gefunden für '{name}'")
+                    failed_count += 1
         
         print(f"\nVerarbeitung abgeschlossen:")
         print(f"  ✓ Erfolgreich: {successful_count} Orte")
@@ -190,13 +442,17 @@ def main():
     """
     Hauptfunktion - verarbeitet die Excel-Datei und erstellt GeoJSON
     """
+    # Einzelne Einträge nur bei Bedarf (DEBUG) protokollieren
+    logging.basicConfig(level=logging.WARNING)
+    
     excel_file = "../data/Orte_Identifikation_factgrid.xlsx"
     output_file = "../data/orte_kronruthenien.geojson"
+    refresh_cache = os.environ.get("WIKIDATA_REFRESH_CACHE") == "1"
 
     print("=== Kronruthenien Orte GeoJSON Generator ===\n")
     
     # Verarbeitung starten
-    process_excel_to_geojson(excel_file, output_file)
+    process_excel_to_geojson(excel_file, output_file, refresh_cache=refresh_cache)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file